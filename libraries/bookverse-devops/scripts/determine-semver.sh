@@ -20,6 +20,11 @@ if ! python3 -c "import yaml" >/dev/null 2>&1; then
     exit 1
 fi
 
+if ! python3 -c "import requests" >/dev/null 2>&1; then
+    echo "❌ Error: requests is required. Install with: pip install requests" >&2
+    exit 1
+fi
+
 APPLICATION_KEY=""
 VERSION_MAP=""
 JFROG_URL=""
@@ -48,17 +48,68 @@ Version: 1.0.0
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import sys
-from typing import List, Optional, Tuple, Dict, Any
-import urllib.request
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple, Dict, Any
 import urllib.parse
 
-# 🔧 Semantic Version Pattern: Precise SemVer 2.0 pattern matching
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without LibYAML
+    from yaml import SafeLoader as _YamlLoader
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # orjson is optional; stdlib json also accepts bytes
+    _json_loads = json.loads
+
+try:
+    import ijson
+except ImportError:  # ijson is optional; AQL results are then read in full
+    ijson = None
+
+# 🔧 Semantic Version Pattern: Reference grammar for X.Y.Z versions; parse_semver
+# implements it with a str.split fast path instead of the regex engine
 SEMVER_RE = re.compile(r"^(\d+)\.(\d+)\.(\d+)$")
 
+# 📦 Artifact Version Patterns: Version extraction from generic paths, Helm
+# chart archives, and Python wheel file names
+_GENERIC_VER_RE = re.compile(r'/(\d+\.\d+\.\d+)(?:/|$)')
+_HELM_VER_RE = re.compile(r'-(\d+\.\d+\.\d+)\.tgz$')
+_WHL_VER_RE = re.compile(r'-(\d+\.\d+\.\d+)-')
+
+# 🔑 Environment Key Sanitizer: Characters not allowed in GITHUB_ENV names
+_ENV_KEY_RE = re.compile(r"[^A-Za-z0-9_]")
+
+# 🌐 Shared HTTP Session: Every call targets the same JFrog host, so keep-alive
+# connections are pooled and reused instead of doing a TLS handshake per request
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# 🏷️ Stage Suffixes: Precomputed repo suffixes for the stage names CI passes
+_STAGE_SUFFIX = {
+    "": "dev",
+    "DEV": "dev",
+    "QA": "qa",
+    "STAGING": "staging",
+    "PROD": "prod",
+    "bookverse-DEV": "dev",
+    "bookverse-QA": "qa",
+    "bookverse-STAGING": "staging",
+    "bookverse-PROD": "prod",
+}
+
 
 def stage_suffix_for_repo(stage: str) -> str:
     """
@@ -82,6 +133,9 @@ def stage_suffix_for_repo(stage: str) -> str:
         >>> stage_suffix_for_repo("DEV")
         'dev'
     """
+    suffix = _STAGE_SUFFIX.get(stage)
+    if suffix is not None:
+        return suffix
     s = (stage or "").strip()
     if not s:
         return "dev"
@@ -110,10 +164,20 @@ def parse_semver(v: str) -> Optional[Tuple[int, int, int]]:
         >>> parse_semver("invalid")
         None
     """
-    m = SEMVER_RE.match(v.strip())
-    if not m:
+    return _parse_semver_cached(v.strip())
+
+
+@lru_cache(maxsize=4096)
+def _parse_semver_cached(v: str) -> Optional[Tuple[int, int, int]]:
+    # Version strings repeat heavily across tag listings; results are
+    # immutable tuples so they are safe to share between callers.
+    parts = v.split(".")
+    if len(parts) != 3:
         return None
-    return int(m.group(1)), int(m.group(2)), int(m.group(3))
+    for p in parts:
+        if not (p.isascii() and p.isdigit() and (p == "0" or p[0] != "0")):
+            return None
+    return int(parts[0]), int(parts[1]), int(parts[2])
 
 
 def bump_patch(v: str) -> str:
@@ -145,16 +209,17 @@ def bump_patch(v: str) -> str:
     return f"{p[0]}.{p[1]}.{p[2] + 1}"
 
 
-def max_semver(values: List[str]) -> Optional[str]:
+def max_semver(values: Iterable[str]) -> Optional[str]:
     """
     Find the highest semantic version from a list of version strings.
     
     This function compares multiple semantic version strings and returns
     the highest version according to SemVer precedence rules. Invalid
-    versions are filtered out during comparison.
+    versions are filtered out during comparison, so callers can pass raw
+    candidates without validating them first.
     
     Args:
-        values (List[str]): List of version strings to compare
+        values (Iterable[str]): Version strings to compare
         
     Returns:
         Optional[str]: Highest valid semantic version or None if no valid versions
@@ -165,103 +230,170 @@ def max_semver(values: List[str]) -> Optional[str]:
         >>> max_semver(["invalid", "not-semver"])
         None
     """
-    parsed = [(parse_semver(v), v) for v in values]
-    parsed = [(t, raw) for t, raw in parsed if t is not None]
-    if not parsed:
+    best_t = None
+    best_raw = None
+    for v in values:
+        t = parse_semver(v)
+        # >= keeps the last of equal versions, as the previous stable sort did
+        if t is not None and (best_t is None or t >= best_t):
+            best_t = t
+            best_raw = v
+    return best_raw
+
+
+# 💾 Response Cache: Opt-in (BOOKVERSE_VERSION_CACHE=1) reuse of JSON responses
+# across invocations within one CI job. A cached listing predates anything
+# published since, so reading it can return an already-used next version;
+# only enable it where repeat invocations must agree on the same version.
+_CACHE_TTL_SECONDS = 60
+
+
+def _cache_path(url: str, headers: Dict[str, str], body: Optional[str] = None) -> Optional[str]:
+    # Restricted to the runner's per-job temp dir; never a shared system temp
+    cache_dir = os.environ.get("RUNNER_TEMP")
+    if os.environ.get("BOOKVERSE_VERSION_CACHE") != "1" or not cache_dir:
         return None
-    parsed.sort(key=lambda x: x[0])
-    return parsed[-1][1]
+    # The credential is part of the key so responses never cross tokens
+    raw = url + (body or "") + headers.get("Authorization", "")
+    key = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"bv_ver_{key}.json")
 
 
-def http_get(url: str, headers: Dict[str, str], timeout: int = 300) -> Any:
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        data = resp.read().decode("utf-8")
+def _cache_read(path: Optional[str]) -> Any:
+    if not path:
+        return None
     try:
-        return json.loads(data)
-    except Exception:
-        return data
+        if time.time() - os.path.getmtime(path) >= _CACHE_TTL_SECONDS:
+            return None
+        with open(path, "rb") as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
 
 
-def http_post(url: str, headers: Dict[str, str], data: str, timeout: int = 300) -> Any:
-    req = urllib.request.Request(url, data=data.encode('utf-8'), headers=headers, method='POST')
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        response_data = resp.read().decode("utf-8")
+def _cache_write(path: Optional[str], payload: Any) -> None:
+    # Only parsed JSON is cached; writes go through a temp file so concurrent
+    # readers never observe a partial entry
+    if not path or not isinstance(payload, (dict, list)):
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        return json.loads(response_data)
-    except Exception:
-        return response_data
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _declares_non_json(r: requests.Response) -> bool:
+    # Bodies declared as JSON, or not declared at all, are parsed as JSON
+    content_type = r.headers.get("Content-Type", "")
+    return bool(content_type) and "json" not in content_type
+
+
+def _decode_response(r: requests.Response) -> Any:
+    # Non-JSON bodies are returned as text without an exception round-trip
+    if _declares_non_json(r):
+        return r.text
+    try:
+        return _json_loads(r.content)
+    except ValueError:
+        return r.text
+
+
+def http_get(url: str, headers: Dict[str, str], timeout: int = 300) -> Any:
+    cache_path = _cache_path(url, headers)
+    cached = _cache_read(cache_path)
+    if cached is not None:
+        return cached
+    r = _SESSION.get(url, headers=headers, timeout=timeout)
+    r.raise_for_status()
+    payload = _decode_response(r)
+    _cache_write(cache_path, payload)
+    return payload
+
+
+def http_post(url: str, headers: Dict[str, str], data: str, timeout: int = 300) -> Any:
+    cache_path = _cache_path(url, headers, data)
+    cached = _cache_read(cache_path)
+    if cached is not None:
+        return cached
+    r = _SESSION.post(url, headers=headers, data=data.encode('utf-8'), timeout=timeout)
+    r.raise_for_status()
+    payload = _decode_response(r)
+    _cache_write(cache_path, payload)
+    return payload
 
 
 def load_version_map(path: str) -> Dict[str, Any]:
-    import yaml
     with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        return yaml.load(f, Loader=_YamlLoader) or {}
 
 
-def find_app_entry(vm: Dict[str, Any], app_key: str) -> Dict[str, Any]:
-    for it in vm.get("applications", []) or []:
-        if (it.get("key") or "").strip() == app_key:
-            return it
-    return {}
+def index_version_map(vm: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Build (once) and return the application-key index of a version map.
 
+    The index is stored on the map under "_index" so repeated lookups are
+    O(1) dict hits instead of scans of the applications list.
+    """
+    index = vm.get("_index")
+    if index is None:
+        index = {
+            (it.get("key") or "").strip(): it
+            for it in reversed(vm.get("applications", []) or [])
+        }
+        vm["_index"] = index
+    return index
 
-def compute_next_application_version(app_key: str, vm: Dict[str, Any], jfrog_url: str, token: str) -> str:
-    base = jfrog_url.rstrip("/") + "/apptrust/api/v1"
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
 
-    
-    latest_url = f"{base}/applications/{urllib.parse.quote(app_key)}/versions?limit=10&order_by=created&order_asc=false"
-    try:
-        latest_payload = http_get(latest_url, headers)
-    except Exception:
-        latest_payload = {}
+def find_app_entry(vm: Dict[str, Any], app_key: str) -> Dict[str, Any]:
+    return index_version_map(vm).get(app_key, {})
 
-    def first_version(obj: Any) -> Optional[str]:
-        if isinstance(obj, dict):
-            arr = (
-                obj.get("versions")
-                or obj.get("results")
-                or obj.get("items")
-                or obj.get("data")
-                or []
-            )
-            if arr:
-                v = (arr[0] or {}).get("version") or (arr[0] or {}).get("name")
-                return v if isinstance(v, str) else None
-        return None
 
-    latest_created = first_version(latest_payload)
-    if isinstance(latest_created, str) and parse_semver(latest_created):
-        return bump_patch(latest_created)
+def compute_next_application_version(
+    app_key: str,
+    vm: Dict[str, Any],
+    base_url: str,
+    token: str,
+    app_key_quoted: Optional[str] = None,
+) -> str:
+    base = base_url + "/apptrust/api/v1"
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    app_key_quoted = app_key_quoted or urllib.parse.quote(app_key)
 
-    url = f"{base}/applications/{urllib.parse.quote(app_key)}/versions?limit=50&order_by=created&order_asc=false"
+    url = f"{base}/applications/{app_key_quoted}/versions?limit=50&order_by=created&order_asc=false"
     try:
         payload = http_get(url, headers)
     except Exception:
         payload = {}
 
-    def extract_versions(obj: Any) -> List[str]:
+    def extract_versions(obj: Any) -> Iterator[str]:
+        # Yields raw candidates only; max_semver parses each one exactly once
         if isinstance(obj, dict):
             arr = (
                 obj.get("versions")
                 or obj.get("results")
                 or obj.get("items")
                 or obj.get("data")
-                or []
             )
-            out = []
-            for it in arr or []:
-                v = (it or {}).get("version") or (it or {}).get("name")
-                if isinstance(v, str) and parse_semver(v):
-                    out.append(v)
-            return out
+            if not isinstance(arr, list):
+                return
+            for it in arr:
+                if not isinstance(it, dict):
+                    continue
+                v = it.get("version") or it.get("name")
+                if isinstance(v, str):
+                    yield v
         elif isinstance(obj, list):
-            return [x for x in obj if isinstance(x, str) and parse_semver(x)]
-        return []
+            for x in obj:
+                if isinstance(x, str):
+                    yield x
 
-    values = extract_versions(payload)
-    latest = max_semver(values)
+    latest = max_semver(extract_versions(payload))
     if latest:
         return bump_patch(latest)
 
@@ -274,21 +406,331 @@ def compute_next_application_version(app_key: str, vm: Dict[str, Any], jfrog_url
 
 
 
+# 🚨 Registry Error Policy: (query label, not-found HTTP statuses, not-found
+# response body markers, registry named in the first-build notice or None to
+# fall back to the seed silently)
+_REGISTRY_ERRORS: Dict[str, Tuple[str, Tuple[int, ...], Tuple[str, ...], Optional[str]]] = {
+    "docker": ("Docker registry", (404,), ("name_unknown",), "Docker registry"),
+    "generic": ("AQL", (404, 400), ("not found", "name_unknown"), "Generic registry"),
+    "helm": ("Helm repository", (400, 404), ("not found",), None),
+    "python": ("Python repository", (400, 404), ("not found",), None),
+}
+
+
+def _is_not_found(e: Exception, statuses: Tuple[int, ...], markers: Tuple[str, ...]) -> bool:
+    # Classify on the HTTP response only: the exception text also carries the
+    # URL (host, port, repo key), which must never decide the outcome
+    response = getattr(e, "response", None)
+    if not isinstance(e, requests.HTTPError) or response is None:
+        return False
+    if response.status_code in statuses:
+        return True
+    # Body markers only qualify client errors; 5xx always aborts, as does
+    # an authentication failure
+    if not 400 <= response.status_code < 500 or response.status_code in (401, 403):
+        return False
+    body = (response.text or "").lower()
+    return any(marker in body for marker in markers)
+
+
+def _handle_registry_error(
+    e: Exception, package_name: str, kind: str, details: Optional[Dict[str, str]] = None
+) -> None:
+    """
+    Classify a registry query failure for a package.
+
+    Not-found responses mean the package has never been published, so the
+    caller falls back to the seed version. Any other failure points at
+    authentication or connectivity problems and aborts the run.
+    """
+    label, statuses, markers, registry = _REGISTRY_ERRORS[kind]
+    if _is_not_found(e, statuses, markers):
+        if registry:
+            print(f"INFO: Package '{package_name}' not found in {registry} (first build)", file=sys.stderr)
+            print(f"INFO: Will use seed version from version-map.yaml", file=sys.stderr)
+        return
+    print(f"ERROR: {label} query failed for {package_name}: {e}", file=sys.stderr)
+    print(f"ERROR: This indicates authentication or connectivity issues with JFrog", file=sys.stderr)
+    for name, value in (details or {}).items():
+        print(f"ERROR: {name}: {value}", file=sys.stderr)
+    print(f"ERROR: Fix authentication before proceeding. Check JFROG_ACCESS_TOKEN.", file=sys.stderr)
+    sys.exit(1)
+
+
+def _aql_search(aql_url: str, headers: Dict[str, str], query: str) -> Any:
+    aql_headers = headers.copy()
+    aql_headers["Content-Type"] = "text/plain"
+    return http_post(aql_url, aql_headers, query)
+
+
+# 🔎 AQL Repository Layout: (repo type, field -> $match pattern) searched per
+# package type. Patterns narrow results to files that can carry a version.
+_AQL_REPOS: Dict[str, Tuple[Tuple[str, Dict[str, str]], ...]] = {
+    "generic": (("generic", {"path": "*/*.*.*"}),),
+    "helm": (("helm", {"name": "*.tgz"}),),
+    "python": (("pypi", {"name": "*.whl"}), ("python", {"name": "*.whl"})),
+    "pypi": (("pypi", {"name": "*.whl"}), ("python", {"name": "*.whl"})),
+}
+
+# Only the newest artifacts can hold the highest version, so single-repo
+# queries are capped instead of returning the whole repository
+_AQL_LIMIT = 50
+
+
+def _repo_key(project_key: Optional[str], service_name: str, repo_type: str, repo_stage: str) -> str:
+    return f"{project_key or 'bookverse'}-{service_name}-internal-{repo_type}-{repo_stage}-local"
+
+
+def _aql_criteria(repo_key: str, matches: Dict[str, str]) -> Dict[str, Any]:
+    criteria: Dict[str, Any] = {"repo": repo_key, "type": "file"}
+    for field, pattern in matches.items():
+        criteria[field] = {"$match": pattern}
+    return criteria
+
+
+def _aql_stream(aql_url: str, headers: Dict[str, str], query: str, timeout: int = 300) -> Iterator[Dict[str, Any]]:
+    """
+    Yield AQL result items as they are parsed off the response stream.
+
+    With ijson installed the body is never held as a whole, so callers start
+    reducing immediately and peak memory stays flat for large repositories.
+    Without ijson this falls back to a buffered _aql_search.
+    """
+    if ijson is None:
+        resp = _aql_search(aql_url, headers, query)
+        if isinstance(resp, dict) and isinstance(resp.get("results"), list):
+            yield from resp["results"]
+        return
+    # Streamed bodies are never materialized, so they bypass the response cache
+    aql_headers = headers.copy()
+    aql_headers["Content-Type"] = "text/plain"
+    with _SESSION.post(
+        aql_url, headers=aql_headers, data=query.encode('utf-8'), timeout=timeout, stream=True
+    ) as r:
+        r.raise_for_status()
+        # Same rule as _decode_response: a declared non-JSON body yields
+        # nothing. Anything else must parse completely; an ijson.JSONError
+        # (e.g. a truncated body) propagates so partial results never decide
+        # the version.
+        if _declares_non_json(r):
+            return
+        r.raw.decode_content = True
+        for item in ijson.items(r.raw, "results.item"):
+            if isinstance(item, dict):
+                yield item
+
+
+def _aql_items(
+    aql_url: str,
+    headers: Dict[str, str],
+    repo_key: str,
+    matches: Dict[str, str],
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]],
+) -> Iterable[Dict[str, Any]]:
+    """Return AQL items for one repo, reusing a batched prefetch when it covers the repo."""
+    if aql_results is not None and repo_key in aql_results:
+        return aql_results[repo_key]
+    criteria = json.dumps(_aql_criteria(repo_key, matches), separators=(",", ":"))
+    query = f'items.find({criteria}).include("name","path","created").sort({{"$desc":["created"]}}).limit({_AQL_LIMIT})'
+    return _aql_stream(aql_url, headers, query)
+
+
+def prefetch_aql_results(
+    base_url: str, headers: Dict[str, str], repos: Dict[str, Dict[str, str]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Fetch items for several repositories with a single compound AQL query.
+
+    The query ORs the per-repo criteria together and the results are split
+    back out by their "repo" field, so K AQL-backed packages cost one
+    round-trip instead of K.
+
+    Args:
+        base_url: JFrog platform base URL
+        headers: Authenticated request headers
+        repos: Repository key -> field $match patterns to search
+
+    Returns:
+        Items per repository key. Empty when there is nothing to batch or the
+        batched query fails; package handlers then query individually and
+        classify any error themselves.
+    """
+    if len(repos) < 2:
+        return {}
+    criteria = json.dumps(
+        {"$or": [_aql_criteria(repo, matches) for repo, matches in repos.items()]},
+        separators=(",", ":"),
+    )
+    aql_url = f"{base_url}/artifactory/api/search/aql"
+    # No _AQL_LIMIT here: a limit applies across the whole $or, and one busy
+    # repository could then crowd the others out of the result set
+    try:
+        resp = _aql_search(aql_url, headers, f'items.find({criteria}).include("repo","name","path")')
+    except Exception:
+        return {}
+    if not isinstance(resp, dict) or not isinstance(resp.get("results"), list):
+        return {}
+    out: Dict[str, List[Dict[str, Any]]] = {repo: [] for repo in repos}
+    for item in resp["results"]:
+        if isinstance(item, dict) and item.get("repo") in out:
+            out[item["repo"]].append(item)
+    return out
+
+
+def _fetch_docker_versions(
+    base_url: str,
+    headers: Dict[str, str],
+    project_key: Optional[str],
+    service_name: str,
+    package_name: str,
+    repo_stage: str,
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> List[str]:
+    existing_versions: List[str] = []
+    try:
+        repo_key = _repo_key(project_key, service_name, "docker", repo_stage)
+        docker_url = f"{base_url}/artifactory/api/docker/{repo_key}/v2/{package_name}/tags/list"
+
+        resp = http_get(docker_url, headers)
+        if isinstance(resp, dict) and "tags" in resp:
+            for tag in resp.get("tags", []):
+                if isinstance(tag, str):
+                    existing_versions.append(tag)
+    except Exception as e:
+        _handle_registry_error(e, package_name, "docker")
+    return existing_versions
+
+
+def _fetch_generic_versions(
+    base_url: str,
+    headers: Dict[str, str],
+    project_key: Optional[str],
+    service_name: str,
+    package_name: str,
+    repo_stage: str,
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> List[str]:
+    existing_versions: List[str] = []
+    repo_key = _repo_key(project_key, service_name, "generic", repo_stage)
+    aql_url = f"{base_url}/artifactory/api/search/aql"
+    try:
+        for item in _aql_items(aql_url, headers, repo_key, _AQL_REPOS["generic"][0][1], aql_results):
+            match = _GENERIC_VER_RE.search(item.get("path", ""))
+            if match:
+                existing_versions.append(match.group(1))
+    except Exception as e:
+        _handle_registry_error(e, package_name, "generic", {"AQL URL": aql_url, "Repo": repo_key})
+    return existing_versions
+
+
+def _fetch_helm_versions(
+    base_url: str,
+    headers: Dict[str, str],
+    project_key: Optional[str],
+    service_name: str,
+    package_name: str,
+    repo_stage: str,
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> List[str]:
+    existing_versions: List[str] = []
+    repo_key = _repo_key(project_key, service_name, "helm", repo_stage)
+    aql_url = f"{base_url}/artifactory/api/search/aql"
+    try:
+        for item in _aql_items(aql_url, headers, repo_key, _AQL_REPOS["helm"][0][1], aql_results):
+            match = _HELM_VER_RE.search(item.get("name", ""))
+            if match:
+                existing_versions.append(match.group(1))
+    except Exception as e:
+        _handle_registry_error(e, package_name, "helm", {"Helm AQL URL": aql_url, "Helm Repo": repo_key})
+    return existing_versions
+
+
+def _fetch_pypi_versions(
+    base_url: str,
+    headers: Dict[str, str],
+    project_key: Optional[str],
+    service_name: str,
+    package_name: str,
+    repo_stage: str,
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> List[str]:
+    existing_versions: List[str] = []
+    aql_url = f"{base_url}/artifactory/api/search/aql"
+    try:
+        # The first repository holding any wheels wins
+        for repo_type, matches in _AQL_REPOS["pypi"]:
+            repo_key = _repo_key(project_key, service_name, repo_type, repo_stage)
+            found = False
+            for item in _aql_items(aql_url, headers, repo_key, matches, aql_results):
+                found = True
+                match = _WHL_VER_RE.search(item.get("name", ""))
+                if match:
+                    existing_versions.append(match.group(1))
+            if found:
+                break
+    except Exception as e:
+        _handle_registry_error(e, package_name, "python")
+    return existing_versions
+
+
+# 🗂️ Package Type Dispatch: Registry lookup per version-map package type
+_HANDLERS = {
+    "docker": _fetch_docker_versions,
+    "generic": _fetch_generic_versions,
+    "helm": _fetch_helm_versions,
+    "python": _fetch_pypi_versions,
+    "pypi": _fetch_pypi_versions,
+}
+
+
+def find_package_entry(vm: Dict[str, Any], app_key: str, package_name: str) -> Dict[str, Any]:
+    for it in (find_app_entry(vm, app_key).get("packages") or []):
+        if (it.get("name") or "").strip() == package_name:
+            return it
+    return {}
+
+
+def is_seed_only(pkg: Dict[str, Any]) -> bool:
+    """Packages flagged seed_only/first_build in the version map skip registry lookups."""
+    return bool(pkg.get("seed_only") or pkg.get("first_build"))
+
+
+def aql_repos_for_packages(
+    app_key: str,
+    package_names: List[str],
+    vm: Dict[str, Any],
+    project_key: Optional[str],
+    repo_stage: str,
+) -> Dict[str, Dict[str, str]]:
+    """Collect the AQL repositories (and file patterns) the given packages will search."""
+    service_name = app_key.replace("bookverse-", "")
+    repos: Dict[str, Dict[str, str]] = {}
+    for name in package_names:
+        pkg = find_package_entry(vm, app_key, name)
+        if is_seed_only(pkg):
+            continue
+        package_type = pkg.get("type", "")
+        for repo_type, matches in _AQL_REPOS.get(package_type, ()):
+            repos[_repo_key(project_key, service_name, repo_type, repo_stage)] = matches
+    return repos
+
+
+# 🧠 Package Tag Memo: Results per (app, package, type, seed, registry target, token digest)
+# so a package requested twice in one process is only resolved once
+_PACKAGE_TAG_CACHE: Dict[Tuple[Any, ...], str] = {}
+
+
 def compute_next_package_tag(
     app_key: str,
     package_name: str,
     vm: Dict[str, Any],
-    jfrog_url: str,
+    base_url: str,
     token: str,
     project_key: Optional[str],
     repo_stage: str = "DEV",
+    aql_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
 ) -> str:
-    entry = find_app_entry(vm, app_key)
-    pkg = None
-    for it in (entry.get("packages") or []):
-        if (it.get("name") or "").strip() == package_name:
-            pkg = it
-            break
+    pkg = find_package_entry(vm, app_key, package_name)
     
     if not pkg:
         raise SystemExit(f"Package {package_name} not found in version map for {app_key}")
@@ -298,147 +740,32 @@ def compute_next_package_tag(
     
     if not seed or not parse_semver(str(seed)):
         raise SystemExit(f"No valid seed for package {app_key}/{package_name}")
+
+    if is_seed_only(pkg):
+        return bump_patch(str(seed))
+
+    # Keyed on a token digest so the bearer token itself is not retained
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cache_key = (app_key, package_name, package_type, str(seed), base_url, token_hash, project_key, repo_stage)
+    cached = _PACKAGE_TAG_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
     
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    service_name = app_key.replace("bookverse-", "")
+
+    handler = _HANDLERS.get(package_type)
+    existing_versions = (
+        handler(base_url, headers, project_key, service_name, package_name, repo_stage, aql_results)
+        if handler
+        else []
+    )
     
-    existing_versions = []
-    
-    if package_type == "docker":
-        try:
-            service_name = app_key.replace("bookverse-", "")
-            repo_key = f"{project_key or 'bookverse'}-{service_name}-internal-docker-{repo_stage}-local"
-            docker_url = f"{jfrog_url.rstrip('/')}/artifactory/api/docker/{repo_key}/v2/{package_name}/tags/list"
-            
-            resp = http_get(docker_url, headers)
-            if isinstance(resp, dict) and "tags" in resp:
-                for tag in resp.get("tags", []):
-                    if isinstance(tag, str) and parse_semver(tag):
-                        existing_versions.append(tag)
-        except Exception as e:
-            error_str = str(e)
-            if "404" in error_str or "NAME_UNKNOWN" in error_str:
-                print(f"INFO: Package '{package_name}' not found in Docker registry (first build)", file=sys.stderr)
-                print(f"INFO: Will use seed version from version-map.yaml", file=sys.stderr)
-            else:
-                print(f"ERROR: Docker registry query failed for {package_name}: {e}", file=sys.stderr)
-                print(f"ERROR: This indicates authentication or connectivity issues with JFrog", file=sys.stderr)
-                print(f"ERROR: Fix authentication before proceeding. Check JFROG_ACCESS_TOKEN.", file=sys.stderr)
-                sys.exit(1)
-    
-    elif package_type == "generic":
-        try:
-            service_name = app_key.replace("bookverse-", "")
-            repo_key = f"{project_key or 'bookverse'}-{service_name}-internal-generic-{repo_stage}-local"
-            
-            aql_query = f'''items.find({{"repo":"{repo_key}","type":"file"}}).include("name","path","actual_sha1")'''
-            aql_url = f"{jfrog_url.rstrip('/')}/artifactory/api/search/aql"
-            aql_headers = headers.copy()
-            aql_headers["Content-Type"] = "text/plain"
-            
-            resp = http_post(aql_url, aql_headers, aql_query)
-            if isinstance(resp, dict) and "results" in resp:
-                for item in resp.get("results", []):
-                    path = item.get("path", "")
-                    name = item.get("name", "")
-                    
-                    import re
-                    version_pattern = r'/(\d+\.\d+\.\d+)(?:/|$)'
-                    match = re.search(version_pattern, path)
-                    if match:
-                        version = match.group(1)
-                        if parse_semver(version):
-                            existing_versions.append(version)
-        except Exception as e:
-            error_str = str(e)
-            if "404" in error_str or "400" in error_str or "not found" in error_str.lower() or "NAME_UNKNOWN" in error_str:
-                print(f"INFO: Package '{package_name}' not found in Generic registry (first build)", file=sys.stderr)
-                print(f"INFO: Will use seed version from version-map.yaml", file=sys.stderr)
-            else:
-                print(f"ERROR: AQL query failed for {package_name}: {e}", file=sys.stderr)
-                print(f"ERROR: This indicates authentication or connectivity issues with JFrog", file=sys.stderr)
-                print(f"ERROR: AQL URL: {aql_url}", file=sys.stderr)
-                print(f"ERROR: Repo: {repo_key}", file=sys.stderr)
-                print(f"ERROR: Fix authentication before proceeding. Check JFROG_ACCESS_TOKEN.", file=sys.stderr)
-                sys.exit(1)
-    
-    elif package_type == "helm":
-        try:
-            service_name = app_key.replace("bookverse-", "")
-            repo_key = f"{project_key or 'bookverse'}-{service_name}-internal-helm-{repo_stage}-local"
-            
-            aql_query = f'''items.find({{"repo":"{repo_key}","type":"file","name":{{"$match":"*.tgz"}}}}).include("name","path")'''
-            aql_url = f"{jfrog_url.rstrip('/')}/artifactory/api/search/aql"
-            aql_headers = headers.copy()
-            aql_headers["Content-Type"] = "text/plain"
-            
-            resp = http_post(aql_url, aql_headers, aql_query)
-            if isinstance(resp, dict) and "results" in resp:
-                for item in resp.get("results", []):
-                    name = item.get("name", "")
-                    
-                    import re
-                    version_pattern = r'-(\d+\.\d+\.\d+)\.tgz$'
-                    match = re.search(version_pattern, name)
-                    if match:
-                        version = match.group(1)
-                        if parse_semver(version):
-                            existing_versions.append(version)
-        except Exception as e:
-            error_str = str(e)
-            if "400" in error_str or "404" in error_str or "not found" in error_str.lower():
-                pass
-            else:
-                print(f"ERROR: Helm repository query failed for {package_name}: {e}", file=sys.stderr)
-                print(f"ERROR: This indicates authentication or connectivity issues with JFrog", file=sys.stderr)
-                print(f"ERROR: Helm AQL URL: {aql_url}", file=sys.stderr)
-                print(f"ERROR: Helm Repo: {repo_key}", file=sys.stderr)
-                print(f"ERROR: Fix authentication before proceeding. Check JFROG_ACCESS_TOKEN.", file=sys.stderr)
-                sys.exit(1)
-    
-    elif package_type == "python" or package_type == "pypi":
-        try:
-            service_name = app_key.replace("bookverse-", "")
-            pypi_repo_key = f"{project_key or 'bookverse'}-{service_name}-internal-pypi-{repo_stage}-local"
-            python_repo_key = f"{project_key or 'bookverse'}-{service_name}-internal-python-{repo_stage}-local"
-            
-            for repo_key in [pypi_repo_key, python_repo_key]:
-                
-                aql_query = f'''items.find({{"repo":"{repo_key}","type":"file","name":{{"$match":"*.whl"}}}}).include("name","path")'''
-                aql_url = f"{jfrog_url.rstrip('/')}/artifactory/api/search/aql"
-                aql_headers = headers.copy()
-                aql_headers["Content-Type"] = "text/plain"
-                
-                resp = http_post(aql_url, aql_headers, aql_query)
-                
-                if isinstance(resp, dict) and "results" in resp and len(resp.get("results", [])) > 0:
-                    for item in resp.get("results", []):
-                        name = item.get("name", "")
-                        
-                        import re
-                        version_pattern = r'-(\d+\.\d+\.\d+)-'
-                        match = re.search(version_pattern, name)
-                        if match:
-                            version = match.group(1)
-                            if parse_semver(version):
-                                existing_versions.append(version)
-                    break
-                    
-        except Exception as e:
-            error_str = str(e)
-            if "400" in error_str or "404" in error_str or "not found" in error_str.lower():
-                pass
-            else:
-                print(f"ERROR: Python repository query failed for {package_name}: {e}", file=sys.stderr)
-                print(f"ERROR: This indicates authentication or connectivity issues with JFrog", file=sys.stderr)
-                print(f"ERROR: Fix authentication before proceeding. Check JFROG_ACCESS_TOKEN.", file=sys.stderr)
-                sys.exit(1)
-    
-    if existing_versions:
-        latest = max_semver(existing_versions)
-        if latest:
-            return bump_patch(latest)
-    
-    return bump_patch(str(seed))
+    # Candidates are validated here, in max_semver, so each is parsed once
+    latest = max_semver(existing_versions)
+    tag = bump_patch(latest or str(seed))
+    _PACKAGE_TAG_CACHE[cache_key] = tag
+    return tag
 
 
 def main():
@@ -458,27 +785,41 @@ def main():
     args = p.parse_args()
 
     vm = load_version_map(args.version_map)
+    index_version_map(vm)
     app_key = args.application_key
-    jfrog_url = args.jfrog_url
+    base_url = args.jfrog_url.rstrip("/")
     token = args.jfrog_token
     repo_stage = stage_suffix_for_repo(args.stage or "DEV")
 
-    app_version = compute_next_application_version(app_key, vm, jfrog_url, token)
-
-    pkg_tags: Dict[str, str] = {}
-    if args.packages:
-        for name in [x.strip() for x in args.packages.split(",") if x.strip()]:
-            pkg_tags[name] = compute_next_package_tag(
-                app_key, name, vm, jfrog_url, token, args.project_key, repo_stage
+    # dict.fromkeys drops repeated names while keeping their first-seen order
+    names = list(dict.fromkeys(x.strip() for x in (args.packages or "").split(",") if x.strip()))
+
+    # Lookups are independent and network-bound, so overlap them on threads
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        app_fut = ex.submit(
+            compute_next_application_version, app_key, vm, base_url, token, urllib.parse.quote(app_key)
+        )
+        aql_results = prefetch_aql_results(
+            base_url,
+            {"Authorization": f"Bearer {token}", "Accept": "application/json"},
+            aql_repos_for_packages(app_key, names, vm, args.project_key, repo_stage),
+        )
+        futs = {
+            name: ex.submit(
+                compute_next_package_tag,
+                app_key, name, vm, base_url, token, args.project_key, repo_stage, aql_results,
             )
+            for name in names
+        }
+        app_version = app_fut.result()
+        pkg_tags: Dict[str, str] = {name: f.result() for name, f in futs.items()}
 
     env_path = os.environ.get("GITHUB_ENV")
     if env_path:
+        lines = [f"APP_VERSION={app_version}\n"]
+        lines.extend(f"DOCKER_TAG_{_ENV_KEY_RE.sub('_', k.upper())}={v}\n" for k, v in pkg_tags.items())
         with open(env_path, "a", encoding="utf-8") as f:
-            f.write(f"APP_VERSION={app_version}\n")
-            for k, v in pkg_tags.items():
-                key = re.sub(r"[^A-Za-z0-9_]", "_", k.upper())
-                f.write(f"DOCKER_TAG_{key}={v}\n")
+            f.write("".join(lines))
 
     out = {
         "application_key": app_key,
@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+import requests
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+import semver_versioning  # noqa: E402
+
+
+def make_response(
+    status_code: int = 200,
+    body: Any = None,
+    content_type: Optional[str] = "application/json",
+    url: str = "https://jfrog.example.com/",
+) -> requests.Response:
+    if isinstance(body, (dict, list)):
+        content = json.dumps(body).encode("utf-8")
+    elif isinstance(body, str):
+        content = body.encode("utf-8")
+    else:
+        content = body or b""
+    r = requests.Response()
+    r.status_code = status_code
+    r.reason = "Error" if status_code >= 400 else "OK"
+    r.url = url
+    if content_type:
+        r.headers["Content-Type"] = content_type
+    r._content = content
+    r.raw = io.BytesIO(content)
+    return r
+
+
+class FakeSession:
+    """Stands in for semver_versioning._SESSION and routes requests to a handler."""
+
+    def __init__(self):
+        self.calls: List[Dict[str, Any]] = []
+        self.handler: Callable[..., requests.Response] = lambda method, url, data: make_response(404)
+
+    def _request(self, method: str, url: str, data: Optional[bytes] = None, **kwargs) -> requests.Response:
+        body = data.decode("utf-8") if isinstance(data, bytes) else data
+        self.calls.append({"method": method, "url": url, "data": body})
+        return self.handler(method, url, body)
+
+    def get(self, url, **kwargs):
+        return self._request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self._request("POST", url, data=data, **kwargs)
+
+
+@pytest.fixture
+def sv(monkeypatch):
+    monkeypatch.delenv("BOOKVERSE_VERSION_CACHE", raising=False)
+    monkeypatch.setattr(semver_versioning, "ijson", None)
+    semver_versioning._PACKAGE_TAG_CACHE.clear()
+    return semver_versioning
+
+
+@pytest.fixture
+def session(sv, monkeypatch) -> FakeSession:
+    fake = FakeSession()
+    monkeypatch.setattr(sv, "_SESSION", fake)
+    return fake
+
+
+@pytest.fixture
+def version_map(sv) -> Dict[str, Any]:
+    vm = {
+        "applications": [
+            {
+                "key": "bookverse-infra",
+                "seeds": {"application": "1.0.3"},
+                "packages": [
+                    {"type": "python", "name": "bookverse-core", "seed": "2.1.7"},
+                    {"type": "generic", "name": "bookverse-devops", "seed": "1.0.9"},
+                    {"type": "helm", "name": "platform-chart", "seed": "0.1.0"},
+                    {"type": "docker", "name": "web", "seed": "3.0.0"},
+                ],
+            }
+        ]
+    }
+    sv.index_version_map(vm)
+    return vm
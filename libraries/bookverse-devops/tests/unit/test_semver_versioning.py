@@ -0,0 +1,381 @@
+import pytest
+import requests
+
+from tests.conftest import make_response
+
+JFROG = "https://jfrog.example.com"
+
+
+class TestRegistryErrors:
+
+    def test_not_found_status_falls_back_to_seed(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(404, {"errors": []}, url=url)
+
+        tag = sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+
+        assert tag == "3.0.1"
+
+    def test_docker_name_unknown_body_falls_back_to_seed(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(
+            400, {"errors": [{"code": "NAME_UNKNOWN"}]}, url=url
+        )
+
+        tag = sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+
+        assert tag == "3.0.1"
+
+    def test_unauthorized_aborts_even_when_url_contains_not_found_markers(self, sv, session, version_map):
+        base = "https://jfrog.example.com:8400"
+        session.handler = lambda method, url, data: make_response(401, "Unauthorized", "text/plain", url=url)
+
+        with pytest.raises(SystemExit) as exc:
+            sv.compute_next_package_tag("bookverse-infra", "bookverse-devops", version_map, base, "t", None, "dev")
+
+        assert exc.value.code == 1
+
+    @pytest.mark.parametrize("package,status,body", [
+        ("bookverse-devops", 500, "File not found"),
+        ("platform-chart", 500, "Artifact not found"),
+        ("web", 503, '{"errors":[{"code":"NAME_UNKNOWN"}]}'),
+        ("web", 502, "<html>upstream not found</html>"),
+    ])
+    def test_server_error_aborts_even_with_not_found_body(self, sv, session, version_map, package, status, body):
+        session.handler = lambda method, url, data: make_response(status, body, "text/plain", url=url)
+
+        with pytest.raises(SystemExit) as exc:
+            sv.compute_next_package_tag("bookverse-infra", package, version_map, JFROG, "t", None, "dev")
+
+        assert exc.value.code == 1
+
+    def test_connection_error_aborts(self, sv, session, version_map):
+        def refuse(method, url, data):
+            raise requests.ConnectionError("Failed to resolve 'jfrog-404.example.com'")
+        session.handler = refuse
+
+        with pytest.raises(SystemExit):
+            sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+
+
+def _aql_item(repo, name, path="x"):
+    return {"repo": repo, "name": name, "path": path}
+
+
+PYPI = "bookverse-infra-internal-pypi-dev-local"
+PYTHON = "bookverse-infra-internal-python-dev-local"
+GENERIC = "bookverse-infra-internal-generic-dev-local"
+HELM = "bookverse-infra-internal-helm-dev-local"
+
+
+class TestAqlBatching:
+
+    def _prefetch(self, sv, version_map, names):
+        repos = sv.aql_repos_for_packages("bookverse-infra", names, version_map, None, "dev")
+        return sv.prefetch_aql_results(JFROG, {"Authorization": "Bearer t"}, repos)
+
+    def test_batched_results_are_split_by_repo(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"results": [
+            _aql_item(GENERIC, "devops.tar.gz", "bookverse-devops/1.0.20"),
+            _aql_item(HELM, "platform-chart-0.3.1.tgz"),
+            _aql_item(GENERIC, "devops.tar.gz", "bookverse-devops/1.0.4"),
+            _aql_item("someone-elses-repo", "platform-chart-9.9.9.tgz"),
+        ]})
+
+        aql_results = self._prefetch(sv, version_map, ["bookverse-devops", "platform-chart"])
+
+        assert len(session.calls) == 1
+        assert '"$or"' in session.calls[0]["data"]
+        assert set(aql_results) == {GENERIC, HELM}
+        assert len(aql_results[GENERIC]) == 2
+        devops = sv.compute_next_package_tag(
+            "bookverse-infra", "bookverse-devops", version_map, JFROG, "t", None, "dev", aql_results
+        )
+        chart = sv.compute_next_package_tag(
+            "bookverse-infra", "platform-chart", version_map, JFROG, "t", None, "dev", aql_results
+        )
+        assert (devops, chart) == ("1.0.21", "0.3.2")
+        assert len(session.calls) == 1
+
+    def test_empty_pypi_repo_falls_through_to_python_repo(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"results": [
+            _aql_item(PYTHON, "bookverse_core-2.1.9-py3-none-any.whl"),
+        ]})
+
+        aql_results = self._prefetch(sv, version_map, ["bookverse-core"])
+        tag = sv.compute_next_package_tag(
+            "bookverse-infra", "bookverse-core", version_map, JFROG, "t", None, "dev", aql_results
+        )
+
+        assert aql_results[PYPI] == []
+        assert tag == "2.1.10"
+        assert len(session.calls) == 1
+
+    def test_failed_batch_falls_back_to_per_repo_queries(self, sv, session, version_map):
+        def handler(method, url, data):
+            if '"$or"' in data:
+                return make_response(500, "boom", "text/plain", url=url)
+            if PYPI in data:
+                return make_response(200, {"results": []})
+            return make_response(200, {"results": [_aql_item(PYTHON, "bookverse_core-2.1.12-py3-none-any.whl")]})
+        session.handler = handler
+
+        aql_results = self._prefetch(sv, version_map, ["bookverse-core"])
+        tag = sv.compute_next_package_tag(
+            "bookverse-infra", "bookverse-core", version_map, JFROG, "t", None, "dev", aql_results
+        )
+
+        assert aql_results == {}
+        assert tag == "2.1.13"
+        assert [PYPI in c["data"] for c in session.calls[1:]] == [True, False]
+
+    def test_generic_query_filters_on_versioned_paths(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"results": [
+            _aql_item(GENERIC, "devops.tar.gz", "bookverse-devops/1.2.0"),
+            _aql_item(GENERIC, "README.md", "docs"),
+            _aql_item(GENERIC, "devops.tar.gz", "bookverse-devops/1.10.0/linux"),
+        ]})
+
+        tag = sv.compute_next_package_tag("bookverse-infra", "bookverse-devops", version_map, JFROG, "t", None, "dev")
+
+        query = session.calls[0]["data"]
+        assert f'"repo":"{GENERIC}"' in query
+        assert '"path":{"$match":"*/*.*.*"}' in query
+        assert ".limit(50)" in query
+        assert tag == "1.10.1"
+
+
+class TestParseSemver:
+
+    @pytest.mark.parametrize("value,expected", [
+        ("1.2.3", (1, 2, 3)),
+        (" 10.20.30 ", (10, 20, 30)),
+        ("0.0.0", (0, 0, 0)),
+    ])
+    def test_valid_versions(self, sv, value, expected):
+        assert sv.parse_semver(value) == expected
+
+    @pytest.mark.parametrize("value", ["01.2.3", "1.02.3", "1.2.03", "1.2", "1.2.3.4", "1.2.x", "1.2.3-rc1", "١.2.3"])
+    def test_invalid_versions(self, sv, value):
+        assert sv.parse_semver(value) is None
+
+    def test_leading_zero_candidates_are_ignored_by_max_semver(self, sv):
+        assert sv.max_semver(["1.2.3", "01.9.9"]) == "1.2.3"
+
+
+class TestApplicationVersion:
+
+    def test_bumps_highest_version_not_newest_created(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"versions": [
+            {"version": "1.0.9"},
+            {"version": "not-semver"},
+            {"version": "1.0.12"},
+        ]})
+
+        version = sv.compute_next_application_version("bookverse-infra", version_map, JFROG, "t")
+
+        assert version == "1.0.13"
+        assert len(session.calls) == 1
+        assert "limit=50" in session.calls[0]["url"]
+
+    def test_falls_back_to_seed_without_versions(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"versions": []})
+
+        assert sv.compute_next_application_version("bookverse-infra", version_map, JFROG, "t") == "1.0.4"
+
+
+class TestPackageTagMemo:
+
+    def test_repeat_lookup_in_process_reuses_result(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"tags": ["3.0.4"]})
+
+        first = sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+        second = sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+
+        assert first == second == "3.0.5"
+        assert len(session.calls) == 1
+
+    def test_memo_does_not_retain_the_raw_token(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"tags": []})
+
+        sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "secret-token", None, "dev")
+
+        assert all("secret-token" not in key for key in sv._PACKAGE_TAG_CACHE)
+
+    def test_different_stage_is_resolved_separately(self, sv, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, {"tags": ["3.0.4"]})
+
+        sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "dev")
+        sv.compute_next_package_tag("bookverse-infra", "web", version_map, JFROG, "t", None, "qa")
+
+        assert len(session.calls) == 2
+
+
+class TestAqlStream:
+
+    @pytest.fixture
+    def streaming(self, sv, monkeypatch):
+        monkeypatch.setattr(sv, "ijson", pytest.importorskip("ijson"))
+        return sv
+
+    def test_streams_result_items(self, streaming, session):
+        session.handler = lambda method, url, data: make_response(200, {"results": [
+            {"name": "chart-0.3.1.tgz"}, {"name": "chart-0.2.0.tgz"},
+        ]})
+
+        items = list(streaming._aql_stream(f"{JFROG}/artifactory/api/search/aql", {}, "q"))
+
+        assert [i["name"] for i in items] == ["chart-0.3.1.tgz", "chart-0.2.0.tgz"]
+
+    def test_non_json_body_yields_nothing(self, streaming, session):
+        session.handler = lambda method, url, data: make_response(200, "<html>proxy</html>", "text/html")
+
+        assert list(streaming._aql_stream(f"{JFROG}/artifactory/api/search/aql", {}, "q")) == []
+
+    def test_truncated_body_raises_instead_of_returning_partial_results(self, streaming, session):
+        body = '{"results":[{"name":"chart-0.3.1.tgz"},{"name":"chart-0.2.0.tgz"},{"name":"chart-0.'
+        session.handler = lambda method, url, data: make_response(200, body)
+
+        with pytest.raises(streaming.ijson.JSONError):
+            list(streaming._aql_stream(f"{JFROG}/artifactory/api/search/aql", {}, "q"))
+
+    @pytest.mark.parametrize("body", ['{"results":[', '{"results":[{"name":"platform-chart-0.', ""])
+    def test_body_truncated_before_first_item_raises(self, streaming, session, body):
+        session.handler = lambda method, url, data: make_response(200, body)
+
+        with pytest.raises(streaming.ijson.JSONError):
+            list(streaming._aql_stream(f"{JFROG}/artifactory/api/search/aql", {}, "q"))
+
+    def test_body_truncated_before_first_item_aborts_tag_computation(self, streaming, session, version_map):
+        session.handler = lambda method, url, data: make_response(200, '{"results":[{"name":"platform-chart-0.')
+
+        with pytest.raises(SystemExit):
+            streaming.compute_next_package_tag(
+                "bookverse-infra", "platform-chart", version_map, JFROG, "t", None, "dev"
+            )
+
+    def test_truncated_pypi_stream_does_not_defer_to_python_repo(self, streaming, session, version_map):
+        def handler(method, url, data):
+            if PYPI in data:
+                return make_response(200, '{"results":[')
+            return make_response(200, {"results": [{"name": "bookverse_core-2.1.9-py3-none-any.whl"}]})
+        session.handler = handler
+
+        with pytest.raises(SystemExit):
+            streaming.compute_next_package_tag(
+                "bookverse-infra", "bookverse-core", version_map, JFROG, "t", None, "dev"
+            )
+        assert len(session.calls) == 1
+
+    def test_truncated_body_aborts_tag_computation(self, streaming, session, version_map):
+        body = '{"results":[{"name":"platform-chart-0.3.1.tgz"},{"name":"platform-chart-0.'
+        session.handler = lambda method, url, data: make_response(200, body)
+
+        with pytest.raises(SystemExit):
+            streaming.compute_next_package_tag(
+                "bookverse-infra", "platform-chart", version_map, JFROG, "t", None, "dev"
+            )
+
+
+class TestResponseCache:
+
+    def _tags(self, sv, session):
+        session.handler = lambda method, url, data: make_response(200, {"tags": ["1.0.0"]})
+        sv.http_get(f"{JFROG}/tags", {"Authorization": "Bearer t"})
+        sv.http_get(f"{JFROG}/tags", {"Authorization": "Bearer t"})
+        return len(session.calls)
+
+    def test_disabled_by_default(self, sv, session, tmp_path, monkeypatch):
+        monkeypatch.setenv("RUNNER_TEMP", str(tmp_path))
+
+        assert self._tags(sv, session) == 2
+        assert list(tmp_path.iterdir()) == []
+
+    def test_opt_in_requires_runner_temp(self, sv, session, monkeypatch):
+        monkeypatch.setenv("BOOKVERSE_VERSION_CACHE", "1")
+        monkeypatch.delenv("RUNNER_TEMP", raising=False)
+
+        assert self._tags(sv, session) == 2
+
+    def test_opt_in_reuses_fresh_entries_per_token(self, sv, session, tmp_path, monkeypatch):
+        monkeypatch.setenv("BOOKVERSE_VERSION_CACHE", "1")
+        monkeypatch.setenv("RUNNER_TEMP", str(tmp_path))
+
+        assert self._tags(sv, session) == 1
+        sv.http_get(f"{JFROG}/tags", {"Authorization": "Bearer other"})
+        assert len(session.calls) == 2
+
+
+class TestDecodeResponse:
+
+    def test_declared_json_is_parsed(self, sv):
+        assert sv._decode_response(make_response(200, {"a": [1]})) == {"a": [1]}
+
+    def test_vendor_json_content_type_is_parsed(self, sv):
+        r = make_response(200, [1], "application/vnd.docker.distribution+json; charset=utf-8")
+
+        assert sv._decode_response(r) == [1]
+
+    def test_html_is_returned_as_text(self, sv):
+        r = make_response(200, '{"looks": "like json"}', "text/html")
+
+        assert sv._decode_response(r) == '{"looks": "like json"}'
+
+    def test_undeclared_json_is_parsed(self, sv):
+        assert sv._decode_response(make_response(200, {"a": 1}, None)) == {"a": 1}
+
+    def test_undeclared_non_json_is_returned_as_text(self, sv):
+        assert sv._decode_response(make_response(200, "plain", None)) == "plain"
+
+    def test_json_declared_empty_body_returns_empty_string(self, sv):
+        assert sv._decode_response(make_response(200, b"")) == ""
+
+
+class TestBufferedAndStreamedAqlAgree:
+
+    @pytest.mark.parametrize("body,content_type,expected", [
+        ({"results": [{"name": "a"}]}, "application/json", [{"name": "a"}]),
+        ('{"results": [{"name": "a"}]}', "text/html", []),
+        ({"results": [{"name": "a"}]}, None, [{"name": "a"}]),
+    ])
+    def test_same_items_for_both_paths(self, sv, session, monkeypatch, body, content_type, expected):
+        session.handler = lambda method, url, data: make_response(200, body, content_type)
+        aql_url = f"{JFROG}/artifactory/api/search/aql"
+
+        buffered = list(sv._aql_stream(aql_url, {}, "q"))
+        monkeypatch.setattr(sv, "ijson", pytest.importorskip("ijson"))
+        streamed = list(sv._aql_stream(aql_url, {}, "q"))
+
+        assert buffered == streamed == expected
+
+
+class TestSeedOnlyPackages:
+
+    @pytest.fixture(params=["seed_only", "first_build"])
+    def flagged_map(self, request, version_map):
+        for pkg in version_map["applications"][0]["packages"]:
+            if pkg["name"] in ("bookverse-core", "web"):
+                pkg[request.param] = True
+        return version_map
+
+    def test_flagged_packages_make_no_registry_calls(self, sv, session, flagged_map):
+        core = sv.compute_next_package_tag("bookverse-infra", "bookverse-core", flagged_map, JFROG, "t", None, "dev")
+        web = sv.compute_next_package_tag("bookverse-infra", "web", flagged_map, JFROG, "t", None, "dev")
+
+        assert (core, web) == ("2.1.8", "3.0.1")
+        assert session.calls == []
+
+    def test_flagged_packages_are_left_out_of_the_prefetch(self, sv, flagged_map):
+        repos = sv.aql_repos_for_packages(
+            "bookverse-infra", ["bookverse-core", "bookverse-devops", "platform-chart"], flagged_map, None, "dev"
+        )
+
+        assert set(repos) == {GENERIC, HELM}
+
+    def test_unflagged_package_is_still_queried(self, sv, session, flagged_map):
+        session.handler = lambda method, url, data: make_response(200, {"results": [
+            _aql_item(GENERIC, "devops.tar.gz", "bookverse-devops/1.0.20"),
+        ]})
+
+        tag = sv.compute_next_package_tag("bookverse-infra", "bookverse-devops", flagged_map, JFROG, "t", None, "dev")
+
+        assert tag == "1.0.21"
+        assert len(session.calls) == 1